@@ -1,11 +1,63 @@
 import discord
 from discord.ext import commands
+import asyncio
+import atexit
 import json
 import os
+import signal
 from dotenv import load_dotenv
 import sys
 import logging
 import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Set, TypedDict
+
+class Team(TypedDict):
+    team_name: str
+    players: List[str]
+    captain_id: int
+    registered_at: str
+
+class TourneyData(TypedDict):
+    slots: int
+    teams: List[Team]
+    confirmed: Set[str]
+
+# Prefer msgspec, which also checks the data against the schema above. orjson
+# and then the stdlib json module are used if msgspec isn't installed.
+try:
+    import msgspec
+
+    dumps = msgspec.json.Encoder().encode
+    loads = msgspec.json.decode
+    decode_data = msgspec.json.Decoder(TourneyData).decode
+    DecodeError = msgspec.DecodeError
+except ImportError:
+    try:
+        import orjson
+
+        def dumps(obj):
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+        loads = orjson.loads
+    except ImportError:
+        def dumps(obj):
+            return json.dumps(obj, separators=(",", ":")).encode()
+
+        loads = json.loads
+
+    decode_data = loads
+    DecodeError = json.JSONDecodeError
+
+# zstandard is optional; without it the data file is stored uncompressed
+try:
+    import zstandard
+
+    ZstdError = zstandard.ZstdError
+except ImportError:
+    zstandard = None
+    ZstdError = DecodeError  # nothing raises ZstdError without zstandard
 
 # Set up logging
 logging.basicConfig(
@@ -17,30 +69,17 @@ logger = logging.getLogger('discord_bot')
 # Load environment variables from .env file
 load_dotenv()
 
+# Bot tokens are a known prefix followed by three dot-separated base64 parts
+_TOKEN_RE = re.compile(r'(?:MT|NT|OT)[A-Za-z0-9_\-]+\.[A-Za-z0-9_\-]+\.[A-Za-z0-9_\-]+')
+
 def validate_token(token):
     """Validate the Discord bot token format."""
     if not token:
         return False, "Token is empty"
     
-    # Log token details (safely)
-    logger.info(f"Token length: {len(token)}")
-    logger.info(f"Token contains dots: {'.' in token}")
-    logger.info(f"Token starts with: {token[:2]}")
-    
-    # Check for common issues
-    if ' ' in token:
-        return False, "Token contains spaces"
-    if '\n' in token:
-        return False, "Token contains newlines"
-    if token.strip() != token:
-        return False, "Token has leading/trailing whitespace"
-    
-    # More lenient token validation
-    if not token.startswith(('MT', 'NT', 'OT')):
-        return False, "Token doesn't start with expected prefix"
-    
-    if '.' not in token:
-        return False, "Token doesn't contain required dots"
+    # Single pass over the token; also rejects spaces, newlines and padding
+    if not _TOKEN_RE.fullmatch(token):
+        return False, "Token doesn't match the expected format (MT/NT/OT prefix, three dot-separated parts, no whitespace)"
     
     if len(token) < 50 or len(token) > 70:
         return False, f"Token length ({len(token)}) is outside expected range (50-70)"
@@ -49,29 +88,24 @@ def validate_token(token):
 
 # Get the bot token from environment variable
 TOKEN = os.getenv('DISCORD_BOT_TOKEN')
-logger.info("Checking Discord bot token...")
 
 if not TOKEN:
     logger.error("DISCORD_BOT_TOKEN environment variable is not set!")
     logger.error("Please set your Discord bot token in Render's environment variables.")
     sys.exit(1)
 
-# Log the raw token (first and last few characters only)
+# Only the first and last few characters of the token are ever logged
 safe_token = f"{TOKEN[:4]}...{TOKEN[-4:]}" if len(TOKEN) > 8 else "***"
-logger.info(f"Raw token (partial): {safe_token}")
 
 # Validate token format
 is_valid, message = validate_token(TOKEN)
 if not is_valid:
-    logger.error(f"Token validation failed: {message}")
+    logger.error("Token validation failed: %s", message)
     logger.error("Please check your token in Render's environment variables.")
     logger.error("Token should be obtained from Discord Developer Portal -> Your App -> Bot -> Reset Token")
     logger.error("Make sure to copy the entire token without any extra spaces")
     sys.exit(1)
 
-logger.info("Token format validation passed")
-logger.info("Attempting to connect to Discord...")
-
 # Set up bot intents
 intents = discord.Intents.default()
 intents.message_content = True
@@ -80,37 +114,294 @@ bot = commands.Bot(command_prefix="!", intents=intents)
 
 # Constants
 DATA_FILE = "tourney_data.json"
+FLUSH_DELAY = 2  # seconds to coalesce bursts of changes into one write
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"  # first bytes of every zstd frame
+# Set COMPRESS_DATA=0 to keep tourney_data.json as plain, readable JSON
+COMPRESS_DATA = os.getenv('COMPRESS_DATA', '1') != '0' and zstandard is not None
+# Path to a SQLite database; when set it replaces tourney_data.json
+DB_FILE = os.getenv('TOURNEY_DB')
+DB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS settings (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    slots INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO settings (id, slots) VALUES (0, 0);
+CREATE TABLE IF NOT EXISTS teams (
+    team_name TEXT PRIMARY KEY,
+    captain_id INTEGER NOT NULL,
+    players TEXT NOT NULL,
+    registered_at TEXT NOT NULL,
+    confirmed INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS teams_captain_id ON teams (captain_id);
+"""
+
+# Replies to command errors, keyed by error class (subclasses match too)
+ERROR_MESSAGES = {
+    commands.MissingPermissions: "You don't have permission to use this command.",
+    commands.MissingRequiredArgument: "Missing required argument: {error.param.name}",
+    commands.BadArgument: "Invalid argument provided.",
+    sqlite3.Error: "Couldn't save that change, please try again.",
+}
+DEFAULT_ERROR_MESSAGE = "An error occurred: {error}"
 
 def load_data():
-    """Load tournament data from JSON file or initialize if it doesn't exist."""
+    """Load tournament data from JSON file, or start empty if it doesn't exist."""
     if os.path.exists(DATA_FILE):
         try:
-            with open(DATA_FILE, 'r') as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            print("Error: Invalid JSON data in tourney_data.json. Initializing new data.")
-            return {"slots": 0, "teams": [], "confirmed": []}
+            with open(DATA_FILE, 'rb') as f:
+                raw = f.read()
+            # Compressed and plain files are both accepted, whatever COMPRESS_DATA says
+            if raw.startswith(ZSTD_MAGIC):
+                if zstandard is None:
+                    raise RuntimeError("tourney_data.json is zstd-compressed but the zstandard package is not installed")
+                raw = zstandard.ZstdDecompressor().decompress(raw)
+            loaded = decode_data(raw)
+        except (DecodeError, ZstdError) as e:
+            # Starting empty would overwrite the file on the next save, so
+            # refuse to start until the file is fixed or removed
+            raise RuntimeError(f"tourney_data.json contains invalid data ({e}); fix or remove it before starting the bot") from e
+        # Confirmed team names are kept as a set for fast membership checks
+        loaded["confirmed"] = set(loaded["confirmed"])
+        return loaded
     else:
-        return {"slots": 0, "teams": [], "confirmed": []}
+        return {"slots": 0, "teams": [], "confirmed": set()}
+
+def _serialize(data):
+    """Encode tournament data, storing the confirmed set as a JSON list."""
+    return dumps({**data, "confirmed": list(data["confirmed"])})
 
-def save_data(data):
-    """Save tournament data to JSON file."""
+def _write_data_file(payload):
+    """Atomically replace the data file with already serialized data."""
+    if COMPRESS_DATA:
+        payload = zstandard.ZstdCompressor(level=3).compress(payload)
+    tmp_file = DATA_FILE + f".{os.getpid()}.tmp"
     try:
-        with open(DATA_FILE, 'w') as f:
-            json.dump(data, f, indent=4)
+        with open(tmp_file, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            # Make sure the new contents are on disk before they replace the old file
+            os.fsync(f.fileno())
+        os.replace(tmp_file, DATA_FILE)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+# Hash of the last payload written, so unchanged data isn't written again
+_last_hash = None
+
+def _changed_payload(data):
+    """Serialize data, or return None if it matches the last payload written."""
+    payload = _serialize(data)
+    return None if hash(payload) == _last_hash else payload
+
+def _save_payload(payload):
+    """Write a payload from _changed_payload, returning False if it failed."""
+    global _last_hash
+    try:
+        _write_data_file(payload)
     except Exception as e:
         print(f"Error saving data: {e}")
+        return False
+    _last_hash = hash(payload)
+    return True
+
+def save_data_sync(data):
+    """Save tournament data to JSON file, blocking until it is written.
+
+    Returns False if the data could not be saved.
+    """
+    payload = _changed_payload(data)
+    return payload is None or _save_payload(payload)
+
+async def save_data(data):
+    """Save tournament data to JSON file without blocking the event loop.
+
+    Returns False if the data could not be saved.
+    """
+    # Serialize here so commands can't modify data while it is dumped
+    payload = _changed_payload(data)
+    if payload is None:
+        return True
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, _save_payload, payload)
+
+# Tournament data, loaded from disk in setup_hook
+data = {"slots": 0, "teams": [], "confirmed": set()}
+
+# Lookup indexes into data["teams"], rebuilt by _index_teams()
+_by_captain = {}
+_by_name_lc = {}
+# Rendered "Captain/Players" text for each team name, shown by !teams
+_display = {}
+
+def _render_team(team):
+    """Render the captain and players of a team for the !teams embed."""
+    return f"Captain: <@{team['captain_id']}>\nPlayers: {', '.join(team['players'])}"
+
+def _index_teams():
+    """Rebuild the captain, team name and display lookups from data["teams"]."""
+    _by_captain.clear()
+    _by_name_lc.clear()
+    _display.clear()
+    for team in data["teams"]:
+        # A captain's first registered team is the one they confirm
+        _by_captain.setdefault(team["captain_id"], team)
+        _by_name_lc[team["team_name"].lower()] = team
+        _display[team["team_name"]] = _render_team(team)
+
+# Set whenever data changes; the flush loop writes it back to disk. Created in
+# setup_hook so it belongs to the loop bot.run() starts (Python < 3.10 binds
+# an Event to the loop that is current when it is created).
+_dirty = None
+_flush_task = None
+
+async def _flush_loop():
+    """Write tournament data to disk shortly after it has been changed."""
+    while True:
+        await _dirty.wait()
+        await asyncio.sleep(FLUSH_DELAY)
+        _dirty.clear()
+        if not await save_data(data):
+            # Keep the changes pending so the next pass (or exit) retries them
+            _dirty.set()
+
+def _flush_now():
+    """Write pending changes to disk immediately (used on shutdown)."""
+    if _dirty is not None and _dirty.is_set():
+        _dirty.clear()
+        save_data_sync(data)
+
+atexit.register(_flush_now)
+signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
 
-# Initialize tournament data
-data = load_data()
+# SQLite connection, only opened when DB_FILE is set. All database work runs
+# on a single worker thread so the connection is never used concurrently.
+_db = None
+_db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tourney-db")
+
+def load_db():
+    """Open the SQLite database and load tournament data from it."""
+    global _db
+    _db = sqlite3.connect(DB_FILE, isolation_level=None, check_same_thread=False)
+    # WAL lets each change be appended instead of rewriting the database
+    _db.execute("PRAGMA journal_mode=WAL")
+    _db.execute("PRAGMA synchronous=NORMAL")
+    is_new = _db.execute("SELECT 1 FROM sqlite_master WHERE name = 'teams'").fetchone() is None
+    _db.executescript(DB_SCHEMA)
+    if is_new and os.path.exists(DATA_FILE):
+        try:
+            _import_data_file()
+        except BaseException:
+            # Drop the schema again so the import is retried on the next start
+            _db.executescript("DROP TABLE teams; DROP TABLE settings;")
+            raise
+
+    (slots,) = _db.execute("SELECT slots FROM settings").fetchone()
+    teams = []
+    confirmed = set()
+    rows = _db.execute(
+        "SELECT team_name, captain_id, players, registered_at, confirmed FROM teams ORDER BY rowid"
+    )
+    for team_name, captain_id, players, registered_at, is_confirmed in rows:
+        teams.append({
+            "team_name": team_name,
+            "players": loads(players),
+            "captain_id": captain_id,
+            "registered_at": registered_at
+        })
+        if is_confirmed:
+            confirmed.add(team_name)
+    return {"slots": slots, "teams": teams, "confirmed": confirmed}
+
+def _import_data_file():
+    """Copy the existing tourney_data.json into a newly created database."""
+    imported = load_data()
+    confirmed = imported["confirmed"]
+    statements = [("UPDATE settings SET slots = ?", (imported["slots"],))]
+    for team in imported["teams"]:
+        statements.append((
+            "INSERT INTO teams (team_name, captain_id, players, registered_at, confirmed) VALUES (?, ?, ?, ?, ?)",
+            (team["team_name"], team["captain_id"], dumps(team["players"]).decode(),
+             team["registered_at"], team["team_name"] in confirmed)
+        ))
+    _execute_db(statements)
+    logger.info("Imported %d teams from %s into %s", len(imported["teams"]), DATA_FILE, DB_FILE)
+
+def _execute_db(statements):
+    """Run (sql, params) pairs against the database in one transaction."""
+    _db.execute("BEGIN")
+    try:
+        for sql, params in statements:
+            _db.execute(sql, params)
+    except BaseException:
+        _db.execute("ROLLBACK")
+        raise
+    _db.execute("COMMIT")
+
+# Database counterparts of each command's change, run on the database thread
+def _db_set_slots(number):
+    """Store a new slot count."""
+    _db.execute("UPDATE settings SET slots = ?", (number,))
+
+def _db_register(team):
+    """Insert a newly registered team."""
+    _db.execute(
+        "INSERT INTO teams (team_name, captain_id, players, registered_at) VALUES (?, ?, ?, ?)",
+        (team["team_name"], team["captain_id"], dumps(team["players"]).decode(), team["registered_at"])
+    )
+
+def _db_confirm(team_name):
+    """Mark a team as confirmed."""
+    _db.execute("UPDATE teams SET confirmed = 1 WHERE team_name = ?", (team_name,))
+
+def _db_reset():
+    """Delete all teams and clear the slot count."""
+    _execute_db([
+        ("DELETE FROM teams", ()),
+        ("UPDATE settings SET slots = 0", ())
+    ])
+
+async def _persist(db_func, *args):
+    """Record a change to the tournament data.
+
+    With a database db_func(*args) writes the change right away and any
+    error is raised to the command; otherwise the JSON file is marked dirty
+    for the flush loop.
+    """
+    if _db is None:
+        _dirty.set()
+        return
+    try:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(_db_executor, db_func, *args)
+    except Exception:
+        logger.exception("Error saving data to %s", DB_FILE)
+        raise
+
+@bot.event
+async def setup_hook():
+    """Load tournament data before connecting to Discord."""
+    global data, _dirty
+    _dirty = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    if DB_FILE:
+        data = await loop.run_in_executor(_db_executor, load_db)
+    else:
+        data = await loop.run_in_executor(None, load_data)
+    _index_teams()
 
 @bot.event
 async def on_ready():
     """Called when the bot is ready and connected to Discord."""
-    logger.info(f"Bot logged in as {bot.user}")
-    logger.info(f"Bot is in {len(bot.guilds)} guilds")
+    global _flush_task
+    if _flush_task is None and _db is None:
+        _flush_task = asyncio.create_task(_flush_loop())
+    logger.info("Bot logged in as %s", bot.user)
+    logger.info("Bot is in %d guilds", len(bot.guilds))
     for guild in bot.guilds:
-        logger.info(f"Connected to guild: {guild.name} (id: {guild.id})")
+        logger.info("Connected to guild: %s (id: %s)", guild.name, guild.id)
     logger.info("------")
 
 @bot.command()
@@ -121,27 +412,32 @@ async def setslots(ctx, number: int):
         await ctx.send("Please provide a positive number of slots.")
         return
     
-    if number < len(data["teams"]):
-        await ctx.send(f"Warning: Reducing slots to {number} will remove {len(data['teams']) - number} teams. Use !reset first if you want to start fresh.")
+    filled = len(data["teams"])
+    if number < filled:
+        await ctx.send(f"Warning: Reducing slots to {number} will remove {filled - number} teams. Use !reset first if you want to start fresh.")
         return
 
-    data["slots"] = number
-    save_data(data)
+    if number != data["slots"]:
+        await _persist(_db_set_slots, number)
+        data["slots"] = number
     await ctx.send(f"Tournament slots set to {number}.")
 
 @bot.command()
 async def register(ctx, team_name: str, *players):
     """Register a team for the tournament."""
+    registered = data["teams"]
+    total = data["slots"]
+
     # Check if slots are available
-    if len(data["teams"]) >= data["slots"]:
+    if len(registered) >= total:
         await ctx.send("All slots are full.")
         return
 
     # Check if team name is already taken
-    for team in data["teams"]:
-        if team_name.lower() == team["team_name"].lower():
-            await ctx.send("This team name is already registered.")
-            return
+    name_lc = team_name.lower()
+    if name_lc in _by_name_lc:
+        await ctx.send("This team name is already registered.")
+        return
 
     # Validate number of players
     if len(players) < 1:
@@ -155,32 +451,47 @@ async def register(ctx, team_name: str, *players):
         "captain_id": ctx.author.id,
         "registered_at": str(ctx.message.created_at)
     }
-    data["teams"].append(team)
-    save_data(data)
+    registered.append(team)
+    _by_captain.setdefault(team["captain_id"], team)
+    _by_name_lc[name_lc] = team
+    _display[team_name] = _render_team(team)
+    try:
+        await _persist(_db_register, team)
+    except Exception:
+        # The team was added above to claim its name and slot; take it back out
+        registered.remove(team)
+        _index_teams()
+        raise
     
     # Send confirmation message
     await ctx.send(
         f"Team '{team_name}' registered successfully!\n"
         f"Players: {', '.join(players)}\n"
         f"Captain: {ctx.author.mention}\n"
-        f"Slots remaining: {data['slots'] - len(data['teams'])}"
+        f"Slots remaining: {total - len(registered)}"
     )
 
 @bot.command()
 async def confirm(ctx):
     """Confirm team registration."""
-    for team in data["teams"]:
-        if team["captain_id"] == ctx.author.id:
-            if team["team_name"] in data["confirmed"]:
-                await ctx.send("Your team is already confirmed.")
-                return
-            
-            data["confirmed"].append(team["team_name"])
-            save_data(data)
-            await ctx.send(f"Team '{team['team_name']}' has been confirmed.")
-            return
-    
-    await ctx.send("You don't have a registered team.")
+    team = _by_captain.get(ctx.author.id)
+    if team is None:
+        await ctx.send("You don't have a registered team.")
+        return
+
+    team_name = team["team_name"]
+    confirmed = data["confirmed"]
+    if team_name in confirmed:
+        await ctx.send("Your team is already confirmed.")
+        return
+
+    confirmed.add(team_name)
+    try:
+        await _persist(_db_confirm, team_name)
+    except Exception:
+        confirmed.discard(team_name)
+        raise
+    await ctx.send(f"Team '{team_name}' has been confirmed.")
 
 @bot.command()
 async def slots(ctx):
@@ -199,7 +510,8 @@ async def slots(ctx):
 @commands.has_permissions(administrator=True)
 async def teams(ctx):
     """List all registered teams (admin only)."""
-    if not data["teams"]:
+    registered = data["teams"]
+    if not registered:
         await ctx.send("No teams registered yet.")
         return
 
@@ -209,11 +521,13 @@ async def teams(ctx):
         color=discord.Color.blue()
     )
     
-    for team in data["teams"]:
-        status = "✅ Confirmed" if team["team_name"] in data["confirmed"] else "⏳ Pending"
+    confirmed = data["confirmed"]
+    for team in registered:
+        team_name = team["team_name"]
+        status = "✅ Confirmed" if team_name in confirmed else "⏳ Pending"
         embed.add_field(
-            name=f"{team['team_name']} {status}",
-            value=f"Captain: <@{team['captain_id']}>\nPlayers: {', '.join(team['players'])}",
+            name=f"{team_name} {status}",
+            value=_display[team_name],
             inline=False
         )
     
@@ -224,31 +538,37 @@ async def teams(ctx):
 async def reset(ctx):
     """Reset all tournament data (admin only)."""
     global data
-    data = {"slots": 0, "teams": [], "confirmed": []}
-    save_data(data)
+    await _persist(_db_reset)
+    data = {"slots": 0, "teams": [], "confirmed": set()}
+    _index_teams()
     await ctx.send("Tournament data has been reset.")
 
 @bot.event
 async def on_command_error(ctx, error):
     """Handle command errors."""
-    if isinstance(error, commands.MissingPermissions):
-        await ctx.send("You don't have permission to use this command.")
-    elif isinstance(error, commands.MissingRequiredArgument):
-        await ctx.send(f"Missing required argument: {error.param.name}")
-    elif isinstance(error, commands.BadArgument):
-        await ctx.send("Invalid argument provided.")
+    # Errors raised inside a command arrive wrapped in CommandInvokeError
+    cause = error.original if isinstance(error, commands.CommandInvokeError) else error
+    for error_type in type(cause).__mro__:
+        message = ERROR_MESSAGES.get(error_type)
+        if message is not None:
+            break
     else:
-        await ctx.send(f"An error occurred: {str(error)}")
+        message = DEFAULT_ERROR_MESSAGE
+    await ctx.send(message.format(error=error))
 
 # Run the bot with error handling
 if __name__ == "__main__":
     try:
-        logger.info("Starting bot...")
-        logger.info("Make sure the bot is invited to your server with proper permissions")
-        logger.info("You can get the invite link from Discord Developer Portal -> OAuth2 -> URL Generator")
+        logger.debug("Token (partial): %s", safe_token)
+        # One startup record; the token fields are also attached for structured handlers
+        logger.info(
+            "Starting bot (token length %d), connecting to Discord...",
+            len(TOKEN),
+            extra={"token_len": len(TOKEN), "token_prefix": TOKEN[:2], "has_dot": '.' in TOKEN}
+        )
         bot.run(TOKEN, log_handler=None)  # Disable discord.py's default logging
     except discord.LoginFailure as e:
-        logger.error(f"Failed to login to Discord: {str(e)}")
+        logger.error("Failed to login to Discord: %s", e)
         logger.error("This usually means the token is invalid or has been reset.")
         logger.error("Please:")
         logger.error("1. Go to Discord Developer Portal")
@@ -259,6 +579,6 @@ if __name__ == "__main__":
         logger.error("6. Update the token in Render's environment variables")
         sys.exit(1)
     except Exception as e:
-        logger.error(f"An unexpected error occurred: {str(e)}")
+        logger.error("An unexpected error occurred: %s", e)
         logger.error("Please check the logs for more details.")
         sys.exit(1) 